@@ -1,11 +1,27 @@
 # app.py - Complete Flask Application with Environment Variables
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-import mysql.connector
-from mysql.connector import Error
 import os
-from datetime import datetime
+
+# Cooperative sockets for gunicorn's gevent worker.
+# Must run before anything below imports socket or threading.
+if os.getenv('USE_GEVENT', 'False').lower() in ('1', 'true', 'yes'):
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import (Flask, render_template, stream_template, request, redirect, url_for, session,
+                   flash, get_flashed_messages, jsonify, g, Response, send_from_directory)
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from werkzeug.utils import secure_filename
+from mysql.connector import Error, errorcode, errors, pooling
+import redis
+import hashlib
+import mimetypes
+import pickle
+import threading
+import weakref
+from collections import OrderedDict
+import time
 from functools import wraps
 from config import Config
 
@@ -16,56 +32,333 @@ app.secret_key = Config.SECRET_KEY
 # Setup upload folder
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Get allowed extensions from config
-ALLOWED_EXTENSIONS = Config.ALLOWED_EXTENSIONS
+# Get allowed extensions from config, as suffixes for str.endswith
+ALLOWED_SUFFIXES = tuple(f".{ext}" for ext in Config.ALLOWED_EXTENSIONS)
 
 # ============================================
 # DATABASE CONNECTION HELPER
 # ============================================
+# Connections dropped by the server ("gone away" / "lost connection")
+RECONNECT_ERRNOS = (errorcode.CR_SERVER_GONE_ERROR, errorcode.CR_SERVER_LOST)
+
+# Shared connection pool, created once so requests skip the connect handshake.
+# Sessions are not reset on checkin: a reset would deallocate the server-side
+# prepared statements cached below. Every request ends its transaction in
+# teardown instead, so no snapshot leaks into the next checkout.
+DB_POOL = pooling.MySQLConnectionPool(
+    pool_name="pc",
+    pool_size=Config.DB_POOL_SIZE,
+    pool_reset_session=False,
+    **Config.get_db_config()
+)
+
+# Prepared cursors per pooled connection object:
+# {cnx: (connection_id, {sql: cursor})} with the inner dict kept in LRU order
+PREPARED_CURSORS = weakref.WeakKeyDictionary()
+
+# The pool raises PoolError at once when empty. Cap checkouts at the pool
+# size so extra requests wait for a free connection instead (the semaphore
+# is gevent-aware once threading is monkey-patched).
+DB_POOL_SLOTS = threading.BoundedSemaphore(Config.DB_POOL_SIZE)
+
 def get_db_connection():
-    """Create and return a database connection"""
+    """Check out a connection from the pool (release_db_connection returns it)"""
+    if not DB_POOL_SLOTS.acquire(timeout=Config.DB_POOL_TIMEOUT):
+        print("Timed out waiting for a database connection")
+        return None
     try:
-        connection = mysql.connector.connect(**Config.get_db_config())
-        return connection
+        return DB_POOL.get_connection()
+    except errors.PoolError as e:
+        print(f"Connection pool exhausted: {e}")
     except Error as e:
         print(f"Error connecting to MySQL: {e}")
+    DB_POOL_SLOTS.release()
+    return None
+
+def release_db_connection(connection):
+    """Return a connection to the pool and free its slot"""
+    try:
+        connection.close()
+    finally:
+        DB_POOL_SLOTS.release()
+
+# ============================================
+# QUERY CACHE (REDIS)
+# ============================================
+# Short timeouts: an unreachable Redis should fall through to MySQL quickly
+# (cache errors are caught and logged) rather than stall every request
+cache = redis.Redis.from_url(
+    Config.REDIS_URL,
+    socket_connect_timeout=Config.REDIS_TIMEOUT,
+    socket_timeout=Config.REDIS_TIMEOUT
+)
+
+# Tables behind the contest listings / leaderboards
+CONTEST_TABLES = ('Contest', 'PhotoContestSubmission', 'Votes')
+LEADERBOARD_TABLES = CONTEST_TABLES + ('Photo', 'User')
+
+def make_cache_key(query, params, fetch_one):
+    """Build a cache key from the normalized query text and bind params"""
+    normalized = ' '.join(query.split())
+    digest = hashlib.sha1(f"{normalized}|{params!r}|{fetch_one}".encode()).hexdigest()
+    return f"qc:{digest}"
+
+def cache_get(key):
+    """Return cached rows, or None on a miss or when Redis is down"""
+    try:
+        data = cache.get(key)
+    except redis.RedisError as e:
+        print(f"Cache error: {e}")
         return None
+    return pickle.loads(data) if data is not None else None
+
+def cache_set(key, rows, tables, ttl):
+    """Store rows and index the key under every table it depends on"""
+    cache_store(key, pickle.dumps(rows), tables, ttl)
+
+def cache_store(key, data, tables, ttl):
+    """Store raw bytes and index the key under every table it depends on"""
+    try:
+        pipe = cache.pipeline()
+        pipe.setex(key, ttl, data)
+        for table in tables:
+            pipe.sadd(f"idx:{table}", key)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Cache error: {e}")
+
+def invalidate(tables):
+    """Drop cached results for tables written in this request (after commit)"""
+    g.stale_tables = g.get('stale_tables', set()) | set(tables)
 
-def execute_query(query, params=None, fetch_one=False, fetch_all=True, commit=False):
-    """Execute a query and return results"""
-    connection = get_db_connection()
-    if not connection:
+def flush_stale_tables(tables):
+    """Delete every cached key indexed under the given tables"""
+    try:
+        for table in tables:
+            index_key = f"idx:{table}"
+            keys = cache.smembers(index_key)
+            if keys:
+                cache.delete(*keys)
+            cache.delete(index_key)
+    except redis.RedisError as e:
+        print(f"Cache error: {e}")
+
+def user_stats_key(user_id):
+    return f"stats:user:{user_id}"
+
+def get_user_stats(user_id):
+    """vw_user_dashboard row for a user, cached until their stats change"""
+    key = user_stats_key(user_id)
+    stats = cache_get(key)
+    if stats is None:
+        stats = execute_query(
+            "SELECT * FROM vw_user_dashboard WHERE UserID = %s",
+            (user_id,),
+            fetch_one=True,
+            prepared=True
+        )
+        if stats is not None:
+            try:
+                cache.setex(key, Config.USER_STATS_TTL, pickle.dumps(stats))
+            except redis.RedisError as e:
+                print(f"Cache error: {e}")
+    return stats
+
+def invalidate_user_stats(user_ids=None):
+    """Drop cached stats for these users, or for everyone (after commit)"""
+    if user_ids is None:
+        g.stale_users = None
+        g.stale_all_users = True
+    elif not g.get('stale_all_users'):
+        g.stale_users = (g.get('stale_users') or set()) | set(user_ids)
+
+def flush_user_stats(user_ids, all_users=False):
+    """Delete cached per-user stats"""
+    try:
+        if all_users:
+            keys = list(cache.scan_iter(match=user_stats_key('*')))
+        else:
+            keys = [user_stats_key(user_id) for user_id in user_ids]
+        if keys:
+            cache.delete(*keys)
+    except redis.RedisError as e:
+        print(f"Cache error: {e}")
+
+# ============================================
+# REQUEST-SCOPED CONNECTION
+# ============================================
+def get_db():
+    """Return the request's pooled connection, checking it out on first use
+
+    Requests answered from the cache never touch MySQL or hold a pool slot.
+    A failed checkout is remembered so later queries don't wait again.
+    """
+    if 'db' not in g:
+        g.db = get_db_connection()
+    return g.db
+
+@app.after_request
+def commit_db_connection(response):
+    """Commit the request's writes while a failure can still change the response"""
+    if not g.get('dirty') or g.get('db') is None:
+        return response
+    
+    try:
+        g.db.commit()
+        g.dirty = False
+        return response
+    except Error as e:
+        print(f"Database error on commit: {e}")
+        g.db.rollback()
+        g.dirty = False
+        g.pop('stale_tables', None)
+        g.pop('stale_users', None)
+        g.pop('stale_all_users', None)
+    
+    if request.path.startswith('/api/'):
+        response = jsonify({'success': False, 'error': 'Database commit failed'})
+        response.status_code = 500
+        return response
+    # Replace the route's success message - nothing was saved
+    session.pop('_flashes', None)
+    flash('Your changes could not be saved. Please try again.', 'danger')
+    return redirect(request.referrer or url_for('index'))
+
+@app.teardown_request
+def close_db_connection(exc):
+    """End the transaction and return the connection to the pool"""
+    db = g.pop('db', None)
+    if db is None:
+        return
+    
+    cursor = g.pop('_cursor', None)
+    stale_tables = g.pop('stale_tables', None)
+    stale_users = g.pop('stale_users', None)
+    stale_all_users = g.pop('stale_all_users', False)
+    try:
+        # Writes were committed in after_request; end any transaction still
+        # open (read-only requests included) so the pooled connection doesn't
+        # keep a stale REPEATABLE READ snapshot
+        if db.in_transaction:
+            db.rollback()
+        if exc is None:
+            if stale_tables:
+                flush_stale_tables(stale_tables)
+            if stale_users or stale_all_users:
+                flush_user_stats(stale_users, stale_all_users)
+    except Error as e:
+        print(f"Database error on teardown: {e}")
+    finally:
+        if cursor:
+            cursor.close()
+        release_db_connection(db)
+
+def get_cursor():
+    """Return the request's dictionary cursor, reusing it between queries"""
+    if g.get('_cursor') is None:
+        # Buffered so a fetchone() never leaves unread rows on the shared connection
+        g._cursor = get_db().cursor(dictionary=True, buffered=True)
+    return g._cursor
+
+def get_prepared_cursor(query):
+    """Return a prepared dictionary cursor for query, cached on the connection
+
+    Re-executing the same statement on its cursor reuses the server-side
+    prepared statement, skipping the parse/plan step.
+    """
+    # g.db is a per-checkout wrapper; cache on the pooled connection behind it
+    cnx = get_db()._cnx
+    connection_id, statements = PREPARED_CURSORS.get(cnx, (None, None))
+    if statements is None or connection_id != cnx.connection_id:
+        # New, or reconnected by us or the pool - the old session's
+        # statements are gone with it
+        statements = OrderedDict()
+        PREPARED_CURSORS[cnx] = (cnx.connection_id, statements)
+    
+    cursor = statements.get(query)
+    if cursor is None:
+        cursor = g.db.cursor(prepared=True, dictionary=True)
+        statements[query] = cursor
+        if len(statements) > Config.PREPARED_CACHE_SIZE:
+            _, evicted = statements.popitem(last=False)
+            evicted.close()
+    else:
+        statements.move_to_end(query)
+    return cursor
+
+def reset_db_connection():
+    """Reconnect the request's connection after the server dropped it"""
+    cursor = g.pop('_cursor', None)
+    if cursor:
+        cursor.close()
+    # Statements prepared on the dropped session are gone with it
+    PREPARED_CURSORS.pop(g.db._cnx, None)
+    g.db.reconnect()
+
+def execute_query(query, params=None, fetch_one=False, fetch_all=True, commit=False, retry=True,
+                  cache_tables=None, ttl=Config.QUERY_CACHE_TTL, prepared=False, rowcount=False):
+    """Execute a query and return results (writes are committed at teardown)
+
+    Reads passing cache_tables are served from Redis until one of those
+    tables is invalidated or the ttl expires. prepared=True runs the
+    statement through a cached server-side prepared statement. Writes
+    return lastrowid, or the affected row count with rowcount=True.
+    """
+    if cache_tables and not commit:
+        key = make_cache_key(query, params, fetch_one)
+        rows = cache_get(key)
+        if rows is not None:
+            return rows
+        rows = execute_query(query, params, fetch_one, fetch_all, prepared=prepared)
+        if rows is not None:
+            cache_set(key, rows, cache_tables, ttl)
+        return rows
+    
+    if get_db() is None:
         return None
     
     try:
-        cursor = connection.cursor(dictionary=True)
+        cursor = get_prepared_cursor(query) if prepared else get_cursor()
         cursor.execute(query, params or ())
         
         if commit:
-            connection.commit()
-            return cursor.lastrowid
+            g.dirty = True
+            return cursor.rowcount if rowcount else cursor.lastrowid
+        elif prepared:
+            # Prepared cursors are unbuffered - always drain the result set
+            rows = cursor.fetchall()
+            if fetch_one:
+                return rows[0] if rows else None
+            return rows if fetch_all else None
         elif fetch_one:
             return cursor.fetchone()
         elif fetch_all:
             return cursor.fetchall()
         
+    except errors.OperationalError as e:
+        # Stale pooled connection - reconnect and retry once (pre-ping)
+        # Not once the request has written: those uncommitted writes went
+        # with the dropped session, and teardown would commit only the rest
+        if retry and e.errno in RECONNECT_ERRNOS and not g.get('dirty'):
+            reset_db_connection()
+            return execute_query(query, params, fetch_one, fetch_all, commit, retry=False,
+                                 prepared=prepared, rowcount=rowcount)
+        print(f"Database error: {e}")
+        return None
     except Error as e:
         print(f"Database error: {e}")
         if commit:
-            connection.rollback()
+            g.db.rollback()
+            g.dirty = False
         return None
-    finally:
-        cursor.close()
-        connection.close()
 
 def call_procedure(proc_name, params=None):
     """Call a stored procedure"""
-    connection = get_db_connection()
-    if not connection:
+    if get_db() is None:
         return None
     
     try:
-        cursor = connection.cursor(dictionary=True)
+        cursor = get_cursor()
         cursor.callproc(proc_name, params or ())
         
         # Fetch results if any
@@ -73,15 +366,40 @@ def call_procedure(proc_name, params=None):
         for result in cursor.stored_results():
             results.extend(result.fetchall())
         
-        connection.commit()
+        g.dirty = True
         return results
     except Error as e:
         print(f"Procedure error: {e}")
-        connection.rollback()
+        g.db.rollback()
+        g.dirty = False
         return None
+
+def iter_query(query, params=None):
+    """Yield rows from an unbuffered (server-side) cursor as they arrive"""
+    if get_db() is None:
+        return
+    
+    cursor = g.db.cursor(dictionary=True, buffered=False)
+    try:
+        cursor.execute(query, params or ())
+        yield from cursor
+    except Error as e:
+        print(f"Database error: {e}")
     finally:
         cursor.close()
-        connection.close()
+
+def fetch_result_sets(proc_name, params=None):
+    """Call a read-only stored procedure and return each result set as a list"""
+    if get_db() is None:
+        return None
+    
+    try:
+        cursor = get_cursor()
+        cursor.callproc(proc_name, params or ())
+        return [result.fetchall() for result in cursor.stored_results()]
+    except Error as e:
+        print(f"Procedure error: {e}")
+        return None
 
 # ============================================
 # AUTHENTICATION DECORATORS
@@ -106,12 +424,43 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# ============================================
+# PASSWORD HASHING
+# ============================================
+PASSWORD_HASHER = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
+
+def hash_password(password):
+    """Hash a password with Argon2id"""
+    return PASSWORD_HASHER.hash(password)
+
+def verify_password(stored_hash, password):
+    """Check a password against an Argon2 or legacy Werkzeug hash"""
+    if not stored_hash.startswith('$argon2'):
+        # pbkdf2:/scrypt: hashes from before the Argon2 switch
+        return check_password_hash(stored_hash, password)
+    try:
+        return PASSWORD_HASHER.verify(stored_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(stored_hash):
+    """True for legacy hashes or Argon2 hashes with outdated parameters"""
+    return (not stored_hash.startswith('$argon2')
+            or PASSWORD_HASHER.check_needs_rehash(stored_hash))
+
 # ============================================
 # FILE UPLOAD HELPER
 # ============================================
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(ALLOWED_SUFFIXES)
+
+def remove_file(filepath):
+    """Delete a file, ignoring one that is already gone"""
+    try:
+        os.unlink(filepath)
+    except FileNotFoundError:
+        pass
 
 # ============================================
 # HOME & AUTH ROUTES
@@ -119,27 +468,11 @@ def allowed_file(filename):
 @app.route('/')
 def index():
     """Home page with active contests"""
-    # Update contest statuses first
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute("""
-            UPDATE Contest
-            SET Status = CASE
-                WHEN NOW() < StartDate THEN 'Upcoming'
-                WHEN NOW() BETWEEN StartDate AND EndDate THEN 'Active'
-                WHEN NOW() > EndDate THEN 'Completed'
-                ELSE Status
-            END
-            WHERE Status NOT IN ('Cancelled')
-        """)
-        connection.commit()
-        cursor.close()
-        connection.close()
-    except:
-        pass
-    
-    contests = execute_query("SELECT * FROM vw_active_contests ORDER BY EndDate ASC")
+    # Status is derived from the contest dates inside the view
+    contests = execute_query(
+        "SELECT * FROM vw_active_contests ORDER BY EndDate ASC",
+        cache_tables=CONTEST_TABLES + ('Admin',)
+    )
     return render_template('index.html', contests=contests)
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -161,11 +494,11 @@ def register():
             return redirect(url_for('register'))
         
         # Hash password
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         
         # Check if email exists
         existing_user = execute_query(
-            "SELECT * FROM User WHERE Email = %s",
+            "SELECT 1 FROM User WHERE Email = %s LIMIT 1",
             (email,),
             fetch_one=True
         )
@@ -193,12 +526,21 @@ def login():
         password = request.form.get('password')
         
         user = execute_query(
-            "SELECT * FROM User WHERE Email = %s",
+            "SELECT UserID, Name, Email, Password FROM User WHERE Email = %s",
             (email,),
-            fetch_one=True
+            fetch_one=True,
+            prepared=True
         )
         
-        if user and check_password_hash(user['Password'], password):
+        if user and verify_password(user['Password'], password):
+            # Migrate legacy / outdated hashes on successful login
+            if password_needs_rehash(user['Password']):
+                execute_query(
+                    "UPDATE User SET Password = %s WHERE UserID = %s",
+                    (hash_password(password), user['UserID']),
+                    commit=True,
+                    prepared=True
+                )
             session['user_id'] = user['UserID']
             session['user_name'] = user['Name']
             session['user_email'] = user['Email']
@@ -225,30 +567,26 @@ def dashboard():
     """User dashboard"""
     user_id = session['user_id']
     
-    # Get user statistics
-    stats = execute_query(
-        "SELECT * FROM vw_user_dashboard WHERE UserID = %s",
-        (user_id,),
-        fetch_one=True
-    )
+    # Get user statistics (cached per user)
+    stats = get_user_stats(user_id)
     
     # Get user's photos
     photos = execute_query("""
         SELECT p.*, 
                GROUP_CONCAT(DISTINCT c.Title) AS Contests,
-               COUNT(DISTINCT v.VoteID) AS TotalVotes
+               COALESCE(SUM(pcs.VoteCount), 0) AS TotalVotes
         FROM Photo p
         LEFT JOIN PhotoContestSubmission pcs ON p.PhotoID = pcs.PhotoID
         LEFT JOIN Contest c ON pcs.ContestID = c.ContestID
-        LEFT JOIN Votes v ON p.PhotoID = v.PhotoID
         WHERE p.UserID = %s
         GROUP BY p.PhotoID
         ORDER BY p.UploadDate DESC
-    """, (user_id,))
+    """, (user_id,), prepared=True)
     
     # Get active contests
     active_contests = execute_query(
-        "SELECT * FROM vw_active_contests ORDER BY EndDate ASC LIMIT 5"
+        "SELECT * FROM vw_active_contests ORDER BY EndDate ASC LIMIT 5",
+        cache_tables=CONTEST_TABLES + ('Admin',)
     )
     
     return render_template('dashboard.html', stats=stats, photos=photos, 
@@ -261,26 +599,28 @@ def dashboard():
 def contests():
     """List all contests"""
     all_contests = execute_query("""
-        SELECT c.*, a.Name AS ManagerName,
-               COUNT(DISTINCT pcs.PhotoID) AS TotalSubmissions,
-               COUNT(DISTINCT v.VoteID) AS TotalVotes
+        SELECT c.ContestID, c.Title, c.StartDate, c.EndDate,
+               fn_contest_status(c.Status, c.StartDate, c.EndDate) AS Status,
+               c.Max_participants, c.Prize_points, c.Entry_fee, c.Result, c.Manager_id,
+               a.Name AS ManagerName,
+               COUNT(pcs.PhotoID) AS TotalSubmissions,
+               COALESCE(SUM(pcs.VoteCount), 0) AS TotalVotes
         FROM Contest c
         LEFT JOIN Admin a ON c.Manager_id = a.AdminID
         LEFT JOIN PhotoContestSubmission pcs ON c.ContestID = pcs.ContestID
-        LEFT JOIN Votes v ON c.ContestID = v.ContestID
         GROUP BY c.ContestID
         ORDER BY c.StartDate DESC
-    """)
+    """, cache_tables=CONTEST_TABLES + ('Admin',))
     return render_template('contests.html', contests=all_contests)
 
 @app.route('/contest/<int:contest_id>')
 def contest_detail(contest_id):
     """Contest details and leaderboard"""
-    contest = execute_query(
-        "SELECT * FROM Contest WHERE ContestID = %s",
-        (contest_id,),
-        fetch_one=True
-    )
+    # Contest row plus the visitor's submissions and votes in one round trip
+    bundle = fetch_result_sets('sp_contest_detail_bundle',
+                               (contest_id, session.get('user_id')))
+    contest_rows, user_photos, voted = bundle if bundle else ([], [], [])
+    contest = contest_rows[0] if contest_rows else None
     
     if not contest:
         flash('Contest not found', 'danger')
@@ -297,40 +637,21 @@ def contest_detail(contest_id):
             u.Name AS PhotographerName,
             u.Email AS PhotographerEmail,
             u.UserID AS PhotographerID,
-            COUNT(DISTINCT v.VoteID) AS TotalVotes,
+            pcs.VoteCount AS TotalVotes,
             pcs.SubmissionTimestamp,
             pcs.SubmissionStatus,
-            RANK() OVER (ORDER BY COUNT(DISTINCT v.VoteID) DESC) AS `Rank`
+            RANK() OVER (ORDER BY pcs.VoteCount DESC) AS `Rank`
         FROM Contest c
         INNER JOIN PhotoContestSubmission pcs ON c.ContestID = pcs.ContestID
         INNER JOIN Photo p ON pcs.PhotoID = p.PhotoID
         INNER JOIN User u ON p.UserID = u.UserID
-        LEFT JOIN Votes v ON p.PhotoID = v.PhotoID AND v.ContestID = c.ContestID
         WHERE c.ContestID = %s
-        GROUP BY c.ContestID, c.Title, p.PhotoID, p.Title, p.FilePath, 
-                 u.Name, u.Email, u.UserID, pcs.SubmissionTimestamp, pcs.SubmissionStatus
         ORDER BY pcs.SubmissionStatus = 'Approved' DESC, `Rank` ASC
-    """, (contest_id,))
-    
-    # Check if user has submitted
-    user_submitted = False
-    user_voted_photos = []
-    
-    if 'user_id' in session:
-        user_photos = execute_query("""
-            SELECT p.PhotoID
-            FROM Photo p
-            INNER JOIN PhotoContestSubmission pcs ON p.PhotoID = pcs.PhotoID
-            WHERE p.UserID = %s AND pcs.ContestID = %s
-        """, (session['user_id'], contest_id))
-        user_submitted = len(user_photos) > 0 if user_photos else False
-        
-        # Get photos user has already voted for
-        voted = execute_query(
-            "SELECT PhotoID FROM Votes WHERE UserID = %s AND ContestID = %s",
-            (session['user_id'], contest_id)
-        )
-        user_voted_photos = [v['PhotoID'] for v in voted] if voted else []
+    """, (contest_id,), cache_tables=LEADERBOARD_TABLES)
+    
+    # Check if user has submitted / which photos they already voted for
+    user_submitted = len(user_photos) > 0
+    user_voted_photos = [v['PhotoID'] for v in voted]
     
     return render_template('contest_detail.html', 
                          contest=contest, 
@@ -376,30 +697,41 @@ def submit_photo(contest_id):
             flash('Invalid file type. Allowed: png, jpg, jpeg, gif', 'danger')
             return redirect(url_for('submit_photo', contest_id=contest_id))
         
-        # Save file
-        filename = secure_filename(f"{session['user_id']}_{int(datetime.now().timestamp())}_{photo_file.filename}")
+        # Save file before the procedure runs: it commits the coin deduction
+        # itself, so a failed write afterwards could no longer be undone
+        filename = secure_filename(f"{session['user_id']}_{time.time_ns()}_{photo_file.filename}")
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        photo_file.save(filepath)
-        
-        # Use stored procedure to submit photo (it handles coin deduction)
-        db_filepath = f"uploads/{filename}"
-        result = call_procedure('sp_submit_photo_to_contest', 
-                              (session['user_id'], contest_id, title, db_filepath))
+        try:
+            photo_file.save(filepath)
+        except OSError as e:
+            print(f"Upload write error: {e}")
+            remove_file(filepath)
+            flash('Could not save the photo. Please try again.', 'danger')
+            return redirect(url_for('submit_photo', contest_id=contest_id))
         
-        if result and len(result) > 0:
-            message = result[0].get('Message', '')
-            if 'successfully' in message.lower():
-                flash(f'Photo submitted successfully! {entry_fee} coins deducted.', 'success')
-                return redirect(url_for('contest_detail', contest_id=contest_id))
+        submitted = False
+        try:
+            # Use stored procedure to submit photo (it handles coin deduction)
+            db_filepath = f"uploads/{filename}"
+            result = call_procedure('sp_submit_photo_to_contest', 
+                                  (session['user_id'], contest_id, title, db_filepath))
+            
+            if result and len(result) > 0:
+                message = result[0].get('Message', '')
+                if 'successfully' in message.lower():
+                    submitted = True
+                    invalidate(['Photo', 'PhotoContestSubmission'])
+                    invalidate_user_stats([session['user_id']])
+                    flash(f'Photo submitted successfully! {entry_fee} coins deducted.', 'success')
+                    return redirect(url_for('contest_detail', contest_id=contest_id))
+                else:
+                    flash(message, 'danger')
             else:
-                # Failed - delete uploaded file
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                flash(message, 'danger')
-        else:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            flash('Submission failed. Please try again.', 'danger')
+                flash('Submission failed. Please try again.', 'danger')
+        finally:
+            # Failed - delete uploaded file
+            if not submitted:
+                remove_file(filepath)
     
     return render_template('submit_photo.html', contest=contest, user_coins=user_coins, entry_fee=entry_fee)
 
@@ -410,61 +742,67 @@ def submit_photo(contest_id):
 @login_required
 def vote(photo_id, contest_id):
     """Cast vote on a photo"""
-    # First check if the contest is active
-    contest = execute_query(
-        "SELECT Status FROM Contest WHERE ContestID = %s",
-        (contest_id,),
-        fetch_one=True
-    )
+    user_id = session['user_id']
     
-    if not contest:
-        flash('Contest not found!', 'danger')
-        return redirect(url_for('contests'))
+    # Insert only if the contest is active, the photo is an approved entry
+    # and not the voter's own; duplicates are skipped by unique_vote
+    inserted = execute_query("""
+        INSERT IGNORE INTO Votes (UserID, PhotoID, ContestID)
+        SELECT %s, pcs.PhotoID, c.ContestID
+        FROM Contest c
+        JOIN PhotoContestSubmission pcs ON pcs.ContestID = c.ContestID
+        JOIN Photo p ON p.PhotoID = pcs.PhotoID
+        WHERE c.ContestID = %s AND pcs.PhotoID = %s
+          AND fn_contest_status(c.Status, c.StartDate, c.EndDate) = 'Active'
+          AND pcs.SubmissionStatus = 'Approved'
+          AND p.UserID <> %s
+    """, (user_id, contest_id, photo_id, user_id), commit=True, prepared=True, rowcount=True)
     
-    if contest['Status'] != 'Active':
-        flash('You can only vote in active contests!', 'warning')
+    if inserted:
+        invalidate(['Votes'])
+        # Voter's VotesCast and the photo owner's VotesReceived changed
+        owner = execute_query(
+            "SELECT UserID FROM Photo WHERE PhotoID = %s",
+            (photo_id,),
+            fetch_one=True,
+            prepared=True
+        )
+        invalidate_user_stats([user_id] + ([owner['UserID']] if owner else []))
+        flash('Vote cast successfully!', 'success')
         return redirect(url_for('contest_detail', contest_id=contest_id))
     
-    # Check if the photo is actually in this contest and approved
-    submission = execute_query("""
-        SELECT pcs.SubmissionStatus, p.UserID 
-        FROM PhotoContestSubmission pcs 
-        JOIN Photo p ON pcs.PhotoID = p.PhotoID 
-        WHERE pcs.PhotoID = %s AND pcs.ContestID = %s
-    """, (photo_id, contest_id), fetch_one=True)
-    
-    if not submission:
-        flash('This photo is not part of this contest!', 'danger')
+    if inserted is None:
+        flash('An error occurred while casting your vote.', 'danger')
         return redirect(url_for('contest_detail', contest_id=contest_id))
     
-    if submission['SubmissionStatus'] != 'Approved':
-        flash('You can only vote for approved photos!', 'warning')
-        return redirect(url_for('contest_detail', contest_id=contest_id))
+    # Nothing inserted - find out which guard failed
+    check = execute_query("""
+        SELECT fn_contest_status(c.Status, c.StartDate, c.EndDate) AS Status,
+               pcs.SubmissionStatus, p.UserID,
+               EXISTS (SELECT 1 FROM Votes v
+                       WHERE v.UserID = %s AND v.PhotoID = %s AND v.ContestID = c.ContestID) AS AlreadyVoted
+        FROM Contest c
+        LEFT JOIN PhotoContestSubmission pcs ON pcs.ContestID = c.ContestID AND pcs.PhotoID = %s
+        LEFT JOIN Photo p ON p.PhotoID = pcs.PhotoID
+        WHERE c.ContestID = %s
+    """, (user_id, photo_id, photo_id, contest_id), fetch_one=True, prepared=True)
     
-    # Check if user is voting on their own photo
-    if submission['UserID'] == session['user_id']:
-        flash('You cannot vote on your own photo!', 'danger')
-        return redirect(url_for('contest_detail', contest_id=contest_id))
+    if not check:
+        flash('Contest not found!', 'danger')
+        return redirect(url_for('contests'))
     
-    try:
-        # Try to insert the vote
-        success = execute_query(
-            "INSERT INTO Votes (UserID, PhotoID, ContestID) VALUES (%s, %s, %s)",
-            (session['user_id'], photo_id, contest_id),
-            commit=True
-        )
-        
-        if success is not None:
-            flash('Vote cast successfully!', 'success')
-        else:
-            flash('An error occurred while casting your vote.', 'danger')
-            
-    except Error as e:
-        error_msg = str(e)
-        if 'duplicate entry' in error_msg.lower():
-            flash('You have already voted for this photo!', 'warning')
-        else:
-            flash(f'Vote failed: {error_msg}', 'danger')
+    if check['Status'] != 'Active':
+        flash('You can only vote in active contests!', 'warning')
+    elif check['SubmissionStatus'] is None:
+        flash('This photo is not part of this contest!', 'danger')
+    elif check['SubmissionStatus'] != 'Approved':
+        flash('You can only vote for approved photos!', 'warning')
+    elif check['UserID'] == user_id:
+        flash('You cannot vote on your own photo!', 'danger')
+    elif check['AlreadyVoted']:
+        flash('You have already voted for this photo!', 'warning')
+    else:
+        flash('An error occurred while casting your vote.', 'danger')
     
     return redirect(url_for('contest_detail', contest_id=contest_id))
 
@@ -476,9 +814,10 @@ def vote(photo_id, contest_id):
 def edit_photo(photo_id):
     """Edit photo title"""
     photo = execute_query(
-        "SELECT * FROM Photo WHERE PhotoID = %s AND UserID = %s",
+        "SELECT PhotoID, Title, FilePath FROM Photo WHERE PhotoID = %s AND UserID = %s",
         (photo_id, session['user_id']),
-        fetch_one=True
+        fetch_one=True,
+        prepared=True
     )
     
     if not photo:
@@ -491,10 +830,13 @@ def edit_photo(photo_id):
         success = execute_query(
             "UPDATE Photo SET Title = %s WHERE PhotoID = %s",
             (new_title, photo_id),
-            commit=True
+            commit=True,
+            prepared=True
         )
         
         if success is not None:
+            invalidate(['Photo'])
+            invalidate_user_stats([session['user_id']])
             flash('Photo title updated successfully!', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -507,34 +849,71 @@ def edit_photo(photo_id):
 def delete_photo(photo_id):
     """Delete photo"""
     photo = execute_query(
-        "SELECT * FROM Photo WHERE PhotoID = %s AND UserID = %s",
+        "SELECT PhotoID, FilePath FROM Photo WHERE PhotoID = %s AND UserID = %s",
         (photo_id, session['user_id']),
-        fetch_one=True
+        fetch_one=True,
+        prepared=True
     )
     
     if not photo:
         flash('Photo not found or unauthorized', 'danger')
         return redirect(url_for('dashboard'))
     
+    # Users whose VotesCast drop when the cascade removes this photo's votes
+    voters = execute_query(
+        "SELECT DISTINCT UserID FROM Votes WHERE PhotoID = %s",
+        (photo_id,),
+        prepared=True
+    ) or []
+    
     # Delete file
     filepath = os.path.join('static', photo['FilePath'])
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    remove_file(filepath)
     
     # Delete from database
     success = execute_query(
         "DELETE FROM Photo WHERE PhotoID = %s",
         (photo_id,),
-        commit=True
+        commit=True,
+        prepared=True
     )
     
     if success is not None:
+        # Cascades to the photo's submissions and votes
+        invalidate(['Photo', 'PhotoContestSubmission', 'Votes'])
+        invalidate_user_stats([session['user_id']] + [v['UserID'] for v in voters])
         flash('Photo deleted successfully!', 'success')
     else:
         flash('Delete failed', 'danger')
     
     return redirect(url_for('dashboard'))
 
+@app.route('/photo/<int:photo_id>/download')
+@login_required
+def download_photo(photo_id):
+    """Download original photo file (owner only)"""
+    photo = execute_query(
+        "SELECT FilePath FROM Photo WHERE PhotoID = %s AND UserID = %s",
+        (photo_id, session['user_id']),
+        fetch_one=True,
+        prepared=True
+    )
+    
+    if not photo:
+        flash('Photo not found or unauthorized', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    filename = os.path.basename(photo['FilePath'])
+    if Config.USE_X_ACCEL:
+        # Empty body - Nginx streams the file itself with sendfile(2)
+        # Nginx keeps the upstream Content-Type, so set the image's own type
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"/internal/uploads/{filename}"
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+
 # ============================================
 # ADMIN ROUTES
 # ============================================
@@ -546,12 +925,20 @@ def admin_login():
         password = request.form.get('password')
         
         admin = execute_query(
-            "SELECT * FROM Admin WHERE Email = %s",
+            "SELECT AdminID, Name, Password_hash FROM Admin WHERE Email = %s",
             (email,),
-            fetch_one=True
+            fetch_one=True,
+            prepared=True
         )
         
-        if admin and check_password_hash(admin['Password_hash'], password):
+        if admin and verify_password(admin['Password_hash'], password):
+            if password_needs_rehash(admin['Password_hash']):
+                execute_query(
+                    "UPDATE Admin SET Password_hash = %s WHERE AdminID = %s",
+                    (hash_password(password), admin['AdminID']),
+                    commit=True,
+                    prepared=True
+                )
             session['admin_id'] = admin['AdminID']
             session['admin_name'] = admin['Name']
             flash(f'Welcome, Admin {admin["Name"]}!', 'success')
@@ -585,11 +972,11 @@ def admin_register():
             return redirect(url_for('admin_register'))
         
         # Hash password
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         
         # Check if admin exists
         existing_admin = execute_query(
-            "SELECT * FROM Admin WHERE Email = %s",
+            "SELECT 1 FROM Admin WHERE Email = %s LIMIT 1",
             (email,),
             fetch_one=True
         )
@@ -617,41 +1004,40 @@ def admin_register():
 @admin_required
 def admin_dashboard():
     """Admin dashboard"""
-    total_users = execute_query("SELECT COUNT(*) as count FROM User", fetch_one=True)
-    total_contests = execute_query("SELECT COUNT(*) as count FROM Contest", fetch_one=True)
-    total_photos = execute_query("SELECT COUNT(*) as count FROM Photo", fetch_one=True)
-    total_votes = execute_query("SELECT COUNT(*) as count FROM Votes", fetch_one=True)
-    
-    recent_submissions = execute_query("""
-        SELECT pcs.*, p.Title AS PhotoTitle, u.Name AS UserName, c.Title AS ContestTitle
-        FROM PhotoContestSubmission pcs
-        INNER JOIN Photo p ON pcs.PhotoID = p.PhotoID
-        INNER JOIN User u ON p.UserID = u.UserID
-        INNER JOIN Contest c ON pcs.ContestID = c.ContestID
-        ORDER BY pcs.SubmissionTimestamp DESC
-        LIMIT 10
-    """)
+    # Site totals and recent submissions in one round trip
+    totals = {'users': 0, 'contests': 0, 'photos': 0, 'votes': 0}
+    recent_submissions = []
+    bundle = fetch_result_sets('sp_admin_dashboard_bundle')
+    if bundle:
+        totals_rows, recent_submissions = bundle
+        totals = totals_rows[0]
     
-    # Get all contests with their status and submission counts
-    all_contests = execute_query("""
-        SELECT c.*, 
-               COUNT(DISTINCT pcs.PhotoID) as TotalSubmissions,
-               COUNT(DISTINCT CASE WHEN pcs.SubmissionStatus = 'Approved' THEN pcs.PhotoID END) as ApprovedSubmissions,
-               COUNT(DISTINCT v.VoteID) as TotalVotes
+    # Get all contests with their status and submission counts - streamed
+    # row by row into the template instead of being fetched up front
+    all_contests = iter_query("""
+        SELECT c.ContestID, c.Title, c.StartDate, c.EndDate,
+               fn_contest_status(c.Status, c.StartDate, c.EndDate) AS Status,
+               c.Max_participants, c.Prize_points, c.Entry_fee, c.Result, c.Manager_id,
+               COUNT(pcs.PhotoID) as TotalSubmissions,
+               COUNT(CASE WHEN pcs.SubmissionStatus = 'Approved' THEN pcs.PhotoID END) as ApprovedSubmissions,
+               COALESCE(SUM(pcs.VoteCount), 0) as TotalVotes
         FROM Contest c
         LEFT JOIN PhotoContestSubmission pcs ON c.ContestID = pcs.ContestID
-        LEFT JOIN Votes v ON c.ContestID = v.ContestID
         GROUP BY c.ContestID
         ORDER BY c.StartDate DESC
     """)
     
-    return render_template('admin_dashboard.html',
-                         total_users=total_users['count'],
-                         total_contests=total_contests['count'],
-                         total_photos=total_photos['count'],
-                         total_votes=total_votes['count'],
-                         submissions=recent_submissions,
-                         contests=all_contests)
+    # Pop flashes now, while the session cookie can still be updated; the
+    # streamed base.html reads them back from the request context cache
+    get_flashed_messages(with_categories=True)
+    
+    return Response(stream_template('admin_dashboard.html',
+                                    total_users=totals['users'],
+                                    total_contests=totals['contests'],
+                                    total_photos=totals['photos'],
+                                    total_votes=totals['votes'],
+                                    submissions=recent_submissions,
+                                    contests=all_contests))
 
 @app.route('/admin/contests/create', methods=['GET', 'POST'])
 @admin_required
@@ -673,6 +1059,7 @@ def create_contest():
               entry_fee, session['admin_id']), commit=True)
         
         if success:
+            invalidate(['Contest'])
             flash('Contest created successfully!', 'success')
             return redirect(url_for('admin_dashboard'))
         else:
@@ -691,6 +1078,7 @@ def approve_submission(submission_id):
     )
     
     if success is not None:
+        invalidate(['PhotoContestSubmission'])
         flash('Submission approved!', 'success')
     else:
         flash('Approval failed', 'danger')
@@ -718,6 +1106,9 @@ def finalize_contest(contest_id):
     
     # Call the stored procedure to finalize and award prizes
     result = call_procedure('sp_award_prize_to_winner', (contest_id,))
+    invalidate(['Contest'])
+    if result and result[0].get('WinnerUserID'):
+        invalidate_user_stats([result[0]['WinnerUserID']])  # winner's coins changed
     
     if result and len(result) > 0:
         message = result[0].get('Message', '')
@@ -741,51 +1132,52 @@ def finalize_contest(contest_id):
 @login_required
 def api_user_stats():
     """Get user statistics as JSON"""
-    stats = execute_query(
-        "SELECT * FROM vw_user_dashboard WHERE UserID = %s",
-        (session['user_id'],),
-        fetch_one=True
-    )
+    stats = get_user_stats(session['user_id'])
     return jsonify(stats)
 
 @app.route('/api/contest/<int:contest_id>/leaderboard')
 def api_contest_leaderboard(contest_id):
     """Get contest leaderboard as JSON"""
-    leaderboard = execute_query(
-        "SELECT * FROM vw_contest_leaderboard WHERE ContestID = %s ORDER BY `Rank`",
-        (contest_id,)
-    )
-    return jsonify(leaderboard)
+    # Encoded JSON is cached as-is, so hits skip both the query and jsonify
+    key = f"lb:json:{contest_id}"
+    try:
+        data = cache.get(key)
+    except redis.RedisError as e:
+        print(f"Cache error: {e}")
+        data = None
+    
+    if data is None:
+        leaderboard = execute_query(
+            "SELECT * FROM vw_contest_leaderboard WHERE ContestID = %s ORDER BY `Rank`",
+            (contest_id,),
+            prepared=True
+        )
+        data = app.json.dumps(leaderboard).encode()
+        if leaderboard is not None:
+            cache_store(key, data, LEADERBOARD_TABLES, Config.QUERY_CACHE_TTL)
+    
+    return Response(data, mimetype='application/json')
 
 @app.route('/api/admin/update-statuses', methods=['POST'])
 def api_update_statuses():
-    """Update all contest statuses based on current time"""
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        # Update statuses
-        cursor.execute("""
-            UPDATE Contest
-            SET Status = CASE
-                WHEN NOW() < StartDate THEN 'Upcoming'
-                WHEN NOW() BETWEEN StartDate AND EndDate THEN 'Active'
-                WHEN NOW() > EndDate THEN 'Completed'
-                ELSE Status
-            END
-            WHERE Status NOT IN ('Cancelled')
-        """)
-        
-        connection.commit()
-        updated_count = cursor.rowcount
-        
-        return jsonify({'success': True, 'updated': updated_count})
-    except Error as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        if connection and connection.is_connected():
-            cursor.close()
-            connection.close()
+    """Persist contest statuses based on current time (scheduler/cron target)"""
+    updated_count = execute_query("""
+        UPDATE Contest
+        SET Status = CASE
+            WHEN NOW() < StartDate THEN 'Upcoming'
+            WHEN NOW() BETWEEN StartDate AND EndDate THEN 'Active'
+            WHEN NOW() > EndDate THEN 'Completed'
+            ELSE Status
+        END
+        WHERE Status NOT IN ('Cancelled')
+    """, commit=True, rowcount=True)
+    
+    if updated_count is None:
+        return jsonify({'success': False, 'error': 'Status update failed'}), 500
+    
+    if updated_count:
+        invalidate(['Contest'])
+    return jsonify({'success': True, 'updated': updated_count})
 
 # ============================================
 # ERROR HANDLERS
@@ -796,10 +1188,16 @@ def not_found(error):
 
 @app.errorhandler(500)
 def internal_error(error):
+    # Unhandled errors still pass through after_request - drop the writes
+    if g.get('db') is not None and g.get('dirty'):
+        g.db.rollback()
+        g.dirty = False
     return render_template('500.html'), 500
 
 # ============================================
 # RUN APP
 # ============================================
+# Development server only - in production run under gunicorn, e.g.
+#   USE_GEVENT=1 gunicorn -k gevent -w 4 --worker-connections 1000 app:app
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,6 +1,10 @@
 import os
 from dotenv import load_dotenv
 
+# Read before .env is loaded: app.py decides whether to monkey-patch from the
+# process environment alone, and use_pure below must agree with it
+USE_GEVENT = os.getenv('USE_GEVENT', 'False').lower() in ('1', 'true', 'yes')
+
 load_dotenv()
 
 class Config:
@@ -9,9 +13,19 @@ class Config:
     DB_USER = os.getenv('DB_USER', 'root')
     DB_PASSWORD = os.getenv('DB_PASSWORD', '')
     DB_NAME = os.getenv('DB_NAME', 'photo_contest_system')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '16'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+    PREPARED_CACHE_SIZE = int(os.getenv('PREPARED_CACHE_SIZE', '64'))
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    REDIS_TIMEOUT = float(os.getenv('REDIS_TIMEOUT', '0.5'))
+    QUERY_CACHE_TTL = int(os.getenv('QUERY_CACHE_TTL', '60'))
+    USER_STATS_TTL = int(os.getenv('USER_STATS_TTL', '300'))
     UPLOAD_FOLDER = 'static/uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    USE_GEVENT = USE_GEVENT
+    # Behind Nginx: hand file downloads to it via X-Accel-Redirect
+    USE_X_ACCEL = os.getenv('USE_X_ACCEL', 'False').lower() in ('1', 'true', 'yes')
     
     @staticmethod
     def get_db_config():
@@ -19,5 +33,10 @@ class Config:
             'host': Config.DB_HOST,
             'user': Config.DB_USER,
             'password': Config.DB_PASSWORD,
-            'database': Config.DB_NAME
+            'database': Config.DB_NAME,
+            'autocommit': False,
+            'raise_on_warnings': False,
+            # C extension decodes rows in C; only the pure-Python protocol
+            # uses the (gevent-patched) socket module
+            'use_pure': Config.USE_GEVENT
         }
\ No newline at end of file
@@ -0,0 +1,31 @@
+-- ============================================
+-- MIGRATION: VOTE COUNTER AND COMPOSITE INDEXES
+-- ============================================
+-- Brings a database created from an older schema.sql up to date.
+-- Run once, before triggers_func.sql (its triggers and views use VoteCount).
+USE photo_contest_system;
+
+-- Denormalized vote total plus the new indexes. Each composite index is
+-- added in the same statement that drops the single-column index it
+-- replaces, so the foreign keys always have a usable index.
+ALTER TABLE PhotoContestSubmission
+    ADD VoteCount INT NOT NULL DEFAULT 0,
+    ADD INDEX idx_contest_vote_count (ContestID, VoteCount DESC),
+    ADD INDEX idx_contest_photo_status (ContestID, PhotoID, SubmissionStatus),
+    DROP INDEX idx_contest_submissions;
+
+ALTER TABLE Votes
+    ADD INDEX idx_photo_contest_votes (PhotoID, ContestID),
+    DROP INDEX idx_photo_votes;
+
+-- Email lookups use the UNIQUE index
+ALTER TABLE User
+    DROP INDEX idx_email;
+
+-- Backfill the counter from existing votes
+UPDATE PhotoContestSubmission pcs
+SET VoteCount = (
+    SELECT COUNT(*)
+    FROM Votes v
+    WHERE v.PhotoID = pcs.PhotoID AND v.ContestID = pcs.ContestID
+);
@@ -15,8 +15,8 @@ CREATE TABLE User (
     Email VARCHAR(100) UNIQUE NOT NULL,
     Password VARCHAR(255) NOT NULL,
     Coins INT DEFAULT 10,
-    CONSTRAINT chk_coins CHECK (Coins >= 0),
-    INDEX idx_email (Email)
+    CONSTRAINT chk_coins CHECK (Coins >= 0)
+    -- Email lookups use the UNIQUE index above
 );
 
 CREATE TABLE Admin (
@@ -63,11 +63,13 @@ CREATE TABLE PhotoContestSubmission (
     ContestID INT NOT NULL,
     SubmissionTimestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
     SubmissionStatus ENUM('Pending', 'Approved', 'Rejected') DEFAULT 'Pending',
+    VoteCount INT NOT NULL DEFAULT 0,
     FOREIGN KEY (PhotoID) REFERENCES Photo(PhotoID) ON DELETE CASCADE,
     FOREIGN KEY (ContestID) REFERENCES Contest(ContestID) ON DELETE CASCADE,
     UNIQUE KEY unique_submission (PhotoID, ContestID),
-    INDEX idx_contest_submissions (ContestID),
-    INDEX idx_photo_submissions (PhotoID)
+    INDEX idx_contest_photo_status (ContestID, PhotoID, SubmissionStatus),
+    INDEX idx_photo_submissions (PhotoID),
+    INDEX idx_contest_vote_count (ContestID, VoteCount DESC)
 );
 
 CREATE TABLE Votes (
@@ -81,7 +83,7 @@ CREATE TABLE Votes (
     FOREIGN KEY (ContestID) REFERENCES Contest(ContestID) ON DELETE CASCADE,
     UNIQUE KEY unique_vote (UserID, PhotoID, ContestID),
     INDEX idx_contest_votes (ContestID),
-    INDEX idx_photo_votes (PhotoID),
+    INDEX idx_photo_contest_votes (PhotoID, ContestID),
     INDEX idx_user_votes (UserID)
 );
 
@@ -52,6 +52,29 @@ BEGIN
 END//
 DELIMITER ;
 
+-- Keep the denormalized vote counter in step with Votes
+DELIMITER //
+CREATE TRIGGER trg_increment_vote_count
+AFTER INSERT ON Votes
+FOR EACH ROW
+BEGIN
+    UPDATE PhotoContestSubmission
+    SET VoteCount = VoteCount + 1
+    WHERE PhotoID = NEW.PhotoID AND ContestID = NEW.ContestID;
+END//
+DELIMITER ;
+
+DELIMITER //
+CREATE TRIGGER trg_decrement_vote_count
+AFTER DELETE ON Votes
+FOR EACH ROW
+BEGIN
+    UPDATE PhotoContestSubmission
+    SET VoteCount = VoteCount - 1
+    WHERE PhotoID = OLD.PhotoID AND ContestID = OLD.ContestID AND VoteCount > 0;
+END//
+DELIMITER ;
+
 -- This trigger is unchanged
 DELIMITER //
 CREATE TRIGGER trg_log_contest_completion
@@ -382,6 +405,44 @@ BEGIN
 END//
 DELIMITER ;
 
+-- Procedure 8: Contest detail bundle (contest + user's submissions and votes)
+DELIMITER //
+CREATE PROCEDURE sp_contest_detail_bundle(IN p_contest_id INT, IN p_user_id INT)
+BEGIN
+    SELECT ContestID, Title, StartDate, EndDate,
+           fn_contest_status(Status, StartDate, EndDate) AS Status,
+           Max_participants, Prize_points, Entry_fee, Result, Manager_id
+    FROM Contest WHERE ContestID = p_contest_id;
+    
+    -- Both sets are empty when p_user_id is NULL (anonymous visitor)
+    SELECT p.PhotoID
+    FROM Photo p
+    INNER JOIN PhotoContestSubmission pcs ON p.PhotoID = pcs.PhotoID
+    WHERE p.UserID = p_user_id AND pcs.ContestID = p_contest_id;
+    
+    SELECT PhotoID FROM Votes WHERE UserID = p_user_id AND ContestID = p_contest_id;
+END//
+DELIMITER ;
+
+-- Procedure 9: Admin dashboard bundle (site totals + recent submissions)
+DELIMITER //
+CREATE PROCEDURE sp_admin_dashboard_bundle()
+BEGIN
+    SELECT (SELECT COUNT(*) FROM User) AS users,
+           (SELECT COUNT(*) FROM Contest) AS contests,
+           (SELECT COUNT(*) FROM Photo) AS photos,
+           (SELECT COUNT(*) FROM Votes) AS votes;
+    
+    SELECT pcs.*, p.Title AS PhotoTitle, u.Name AS UserName, c.Title AS ContestTitle
+    FROM PhotoContestSubmission pcs
+    INNER JOIN Photo p ON pcs.PhotoID = p.PhotoID
+    INNER JOIN User u ON p.UserID = u.UserID
+    INNER JOIN Contest c ON pcs.ContestID = c.ContestID
+    ORDER BY pcs.SubmissionTimestamp DESC
+    LIMIT 10;
+END//
+DELIMITER ;
+
 -- ============================================
 -- SECTION 4: FUNCTIONS (No Changes)
 -- ============================================
@@ -396,6 +457,23 @@ BEGIN
 END//
 DELIMITER ;
 
+-- Contest status derived from the clock, so it never has to be persisted
+-- per request. Completed/Cancelled are terminal and kept as stored.
+DELIMITER //
+CREATE FUNCTION fn_contest_status(p_status VARCHAR(20), p_start DATETIME, p_end DATETIME)
+RETURNS VARCHAR(20)
+NOT DETERMINISTIC
+NO SQL
+BEGIN
+    RETURN CASE
+        WHEN p_status IN ('Completed', 'Cancelled') THEN p_status
+        WHEN NOW() < p_start THEN 'Upcoming'
+        WHEN NOW() BETWEEN p_start AND p_end THEN 'Active'
+        ELSE 'Completed'
+    END;
+END//
+DELIMITER ;
+
 DELIMITER //
 CREATE FUNCTION fn_get_photo_votes(p_photo_id INT, p_contest_id INT)
 RETURNS INT
@@ -488,30 +566,29 @@ SELECT
     c.ContestID, c.Title AS ContestTitle,
     p.PhotoID, p.Title AS PhotoTitle,
     u.Name AS PhotographerName, u.Email AS PhotographerEmail,
-    COUNT(v.VoteID) AS TotalVotes,
+    pcs.VoteCount AS TotalVotes,
     pcs.SubmissionTimestamp,
-    RANK() OVER (PARTITION BY c.ContestID ORDER BY COUNT(v.VoteID) DESC) AS `Rank`
+    RANK() OVER (PARTITION BY c.ContestID ORDER BY pcs.VoteCount DESC) AS `Rank`
 FROM Contest c
 INNER JOIN PhotoContestSubmission pcs ON c.ContestID = pcs.ContestID
 INNER JOIN Photo p ON pcs.PhotoID = p.PhotoID
 INNER JOIN User u ON p.UserID = u.UserID
-LEFT JOIN Votes v ON p.PhotoID = v.PhotoID AND v.ContestID = c.ContestID
-WHERE pcs.SubmissionStatus = 'Approved'
-GROUP BY c.ContestID, c.Title, p.PhotoID, p.Title, u.Name, u.Email, pcs.SubmissionTimestamp;
+WHERE pcs.SubmissionStatus = 'Approved';
 
 CREATE OR REPLACE VIEW vw_active_contests AS
 SELECT 
-    c.ContestID, c.Title, c.StartDate, c.EndDate, c.Status,
+    c.ContestID, c.Title, c.StartDate, c.EndDate,
+    fn_contest_status(c.Status, c.StartDate, c.EndDate) AS Status,
     c.Max_participants, c.Prize_points, c.Entry_fee,
     a.Name AS ManagerName,
-    COUNT(DISTINCT pcs.PhotoID) AS TotalSubmissions,
-    COUNT(DISTINCT v.VoteID) AS TotalVotes,
+    COUNT(pcs.PhotoID) AS TotalSubmissions,
+    COALESCE(SUM(pcs.VoteCount), 0) AS TotalVotes,
     TIMESTAMPDIFF(HOUR, NOW(), c.EndDate) AS HoursRemaining
 FROM Contest c
 LEFT JOIN Admin a ON c.Manager_id = a.AdminID
 LEFT JOIN PhotoContestSubmission pcs ON c.ContestID = pcs.ContestID
-LEFT JOIN Votes v ON c.ContestID = v.ContestID
-WHERE c.Status = 'Active'
+WHERE c.Status NOT IN ('Completed', 'Cancelled')
+  AND NOW() BETWEEN c.StartDate AND c.EndDate
 GROUP BY c.ContestID, c.Title, c.StartDate, c.EndDate, c.Status, 
          c.Max_participants, c.Prize_points, c.Entry_fee, a.Name;
 